@@ -62,7 +62,7 @@ class QTransform(Transform):
         if initial_value is None:
             self.f = []
             for i in range(10):
-                self.f.append(PlanarFlow(dim=in_dim))
+                self.f.append(PlanarFlow(dim=in_dim, dtype=tf.float64))
 
     def operator(self, x):
         out = x
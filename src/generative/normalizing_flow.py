@@ -1,5 +1,6 @@
 import numpy as np
 import tensorflow as tf
+from tensorflow.contrib.compiler import jit
 
 from variational import MultiLayerPerceptron
 
@@ -7,7 +8,7 @@ from variational import MultiLayerPerceptron
 class PlanarFlow(object):
     """Class for defining operations for a normalizing flow."""
 
-    def __init__(self, dim, w=None, b=None, u=None):
+    def __init__(self, dim, w=None, b=None, u=None, dtype=tf.float32):
         """Sets up the parameters of a planar normalizing flow.
 
         Parameters:
@@ -18,18 +19,43 @@ class PlanarFlow(object):
             shape should be (N)
         u: tf.Tensor or None
             shape should be (N, dim)
+        dtype: tf.DType
+            Data type of the variables created when w, b or u is None.
+            Ignored otherwise, in which case the data type of w is used.
         """
         self.dim = dim
+        self.dtype = dtype
         if w is None or b is None or u is None:
             self.create_flow_variables()
         else:
             self.w = w
             self.b = b
             self.u = u
-        # Enforcing reversibility.
-        self.u_bar = self.reversible_constraint()
+            self.dtype = self.w.dtype.base_dtype
+        if not self.w.shape[-1].is_compatible_with(self.dim):
+            raise ValueError(
+                'Dimension of w should be {}'.format(self.dim))
+        # Enforcing reversibility. The dot product of u_bar and w only
+        # depends on the parameters so it is shared by every
+        # log-det-Jacobian computation.
+        self.u_bar, self.uw = self.reversible_constraint()
         # Total number of flows.
         self.n_flows = self.u.shape[0].value
+        # Parameters arranged once for the shape of the inputs so that
+        # the flow operations are the same for single and multiple flows.
+        # w_mm is transposed by the matmul itself through transpose_b.
+        if self.is_single_flow():
+            # Inputs of shape [?, self.dim].
+            self.w_mm = self.w
+            self.b_mm = self.b
+            self.u_bar_mm = self.u_bar
+            self.uw_mm = self.uw
+        else:
+            # Inputs of shape [self.n_flows, ?, self.dim].
+            self.w_mm = tf.expand_dims(self.w, 1)
+            self.b_mm = tf.reshape(self.b, [-1, 1, 1])
+            self.u_bar_mm = tf.expand_dims(self.u_bar, 1)
+            self.uw_mm = tf.expand_dims(self.uw, 1)
 
     def get_flow_number(self):
         return self.n_flows
@@ -40,16 +66,41 @@ class PlanarFlow(object):
 
     def create_flow_variables(self):
         """Sets up variables for the single planar flow."""
-        self.w = tf.Variable(np.random.normal(0, 1, [1, self.dim]))
-        self.b = tf.Variable(np.random.normal(0, 1, 1))
-        self.u = tf.Variable(np.random.normal(0, 1, [1, self.dim]))
+        np_dtype = self.dtype.as_numpy_dtype
+        self.w = tf.Variable(
+            np.random.normal(0, 1, [1, self.dim]).astype(np_dtype))
+        self.b = tf.Variable(np.random.normal(0, 1, 1).astype(np_dtype))
+        self.u = tf.Variable(
+            np.random.normal(0, 1, [1, self.dim]).astype(np_dtype))
 
     def reversible_constraint(self):
+        """Computes u_bar such that u_bar . w > -1.
+
+        Returns:
+        --------
+        tuple of tensorflow.Tensor where the first element is u_bar and
+        the second is u_bar . w of shape (N, 1).
+        """
         dot = tf.reduce_sum((self.u * self.w), axis=1, keepdims=True)
-        scalar = - 1 + tf.nn.softplus(dot) - dot
         norm_squared = tf.reduce_sum(self.w * self.w, axis=1, keepdims=True)
-        comp = scalar * self.w / norm_squared
-        return self.u + comp  
+        # softplus(dot) - dot written as softplus(-dot) which does not
+        # suffer from cancellation for large dot. The division is done on
+        # the per-flow scalar rather than on every element of w.
+        scalar = (- 1 + tf.nn.softplus(- dot)) / norm_squared
+        u_bar = self.u + scalar * self.w
+        # u_bar . w is softplus(dot) - 1 analytically. Taking it from dot
+        # rather than reducing u_bar * w keeps it above -1, reducing the
+        # product cancels and can drop below -1 which makes log1p NaN.
+        uw = tf.nn.softplus(dot) - 1.0
+        return u_bar, uw
+
+    def dialation(self, inputs):
+        """Computes w . inputs + b for every input.
+
+        w is transposed by the matmul through transpose_b rather than by
+        a separate transpose op.
+        """
+        return tf.matmul(inputs, self.w_mm, transpose_b=True) + self.b_mm
 
     def transform(self, inputs):
         """Transforms the inputs according to the state of the flow.
@@ -60,16 +111,14 @@ class PlanarFlow(object):
         Shape should be [self.n_flows, ?, self.dim] if self.n_flows > 1.
         If self.n_flows == 1 then shape should be [?, self.dim].
         """
-        if self.is_single_flow():
-            dialation = tf.matmul(inputs, self.w, transpose_b=True) + self.b
-            return inputs + self.u_bar * tf.tanh(dialation)
-        else:
-            dialation = tf.matmul(inputs, tf.expand_dims(self.w, 2)) +\
-            tf.expand_dims(tf.expand_dims(self.b, 1), 2)
-            return inputs + tf.expand_dims(self.u_bar, 1) * tf.tanh(dialation)
+        dialation = self.dialation(inputs)
+        return inputs + self.u_bar_mm * tf.tanh(dialation)
 
     def log_det_jacobian(self, inputs):
         """Computes log-det-Jacobian for combination of inputs, flows.
+
+        The reversibility constraint guarantees u_bar . w > -1, hence the
+        Jacobian determinant 1 + u_bar . w * psi is always positive.
         
         Parameters:
         -----------
@@ -77,24 +126,150 @@ class PlanarFlow(object):
         Shape should be [self.n_flows, ?, self.dim] if self.n_flows > 1.
         If self.n_flows == 1 then shape should be [?, self.dim].
         """
-        if self.is_single_flow():
-            dialation = tf.matmul(inputs, self.w, transpose_b=True) + self.b
-            psi = 1.0 - tf.pow(tf.tanh(dialation), 2)
-            det_jac = tf.matmul(self.u_bar, self.w, transpose_b=True) * psi
-            return - tf.squeeze(tf.log(tf.abs(1 + det_jac)))
+        dialation = self.dialation(inputs)
+        non_lin = tf.tanh(dialation)
+        psi = 1.0 - non_lin * non_lin
+        det_jac = self.uw_mm * psi
+        return - tf.squeeze(tf.log1p(det_jac))
+
+    def transform_and_logdet(self, inputs):
+        """Transforms the inputs and computes the log-det-Jacobian.
+
+        Equivalent to calling transform and log_det_jacobian on the same
+        inputs, except the dilation and its tanh are computed only once.
+
+        Parameters:
+        -----------
+        inputs: tensorflow.Tensor
+        Shape should be [self.n_flows, ?, self.dim] if self.n_flows > 1.
+        If self.n_flows == 1 then shape should be [?, self.dim].
+
+        Returns:
+        --------
+        tuple of tensorflow.Tensor where the first element is the
+        transformed inputs and the second is the log-det-Jacobian term.
+        """
+        dialation = self.dialation(inputs)
+        non_lin = tf.tanh(dialation)
+        transformed = inputs + self.u_bar_mm * non_lin
+        psi = 1.0 - non_lin * non_lin
+        det_jac = self.uw_mm * psi
+        log_det = - tf.squeeze(tf.log1p(det_jac), axis=-1)
+        return transformed, log_det
+
+
+def stack_flow_params(flows):
+    """Stacks the parameters of a list of flows.
+
+    Parameters:
+    -----------
+    flows: list of PlanarFlow or list of StackedPlanarFlow
+        Flows whose parameters have identical shapes.
+
+    Returns:
+    --------
+    tuple of size 3 where the elements are the w, b and u parameters of
+    the flows stacked along a new leading axis of size len(flows).
+    """
+    all_w = tf.stack([flow.w for flow in flows])
+    all_b = tf.stack([flow.b for flow in flows])
+    all_u = tf.stack([flow.u for flow in flows])
+    return all_w, all_b, all_u
+
+
+class StackedPlanarFlow(object):
+    """Class for a sequence of planar flows with stacked parameters."""
+
+    def __init__(self, dim, num_layers=1, w=None, b=None, u=None,
+                 dtype=tf.float32):
+        """Sets up the parameters of a sequence of planar flow layers.
+
+        Parameters:
+        -----------
+        dim: int
+            Dimensionality of the input of the flows.
+        num_layers: int
+            Number of flow layers. Ignored if w, b and u are given.
+        w: tf.Tensor or None
+            shape should be (num_layers, N, dim)
+        b: tf.Tensor or None
+            shape should be (num_layers, N)
+        u: tf.Tensor or None
+            shape should be (num_layers, N, dim)
+        dtype: tf.DType
+            Data type of the variables created when w, b or u is None.
+            Ignored otherwise, in which case the data type of w is used.
+        """
+        self.dim = dim
+        self.dtype = dtype
+        self.num_layers = num_layers
+        if w is None or b is None or u is None:
+            self.create_flow_variables()
         else:
-            dialation = tf.matmul(inputs, tf.expand_dims(self.w, 2)) +\
-            tf.expand_dims(tf.expand_dims(self.b, 1), 2)
-            psi = 1.0 - tf.pow(tf.tanh(dialation), 2)
-            dot = tf.reduce_sum(self.u_bar * self.w, axis=1, keepdims=True)
-            dot = tf.expand_dims(dot, 1)
-            det_jac = dot * psi
-            return - tf.squeeze(tf.log(tf.abs(1 + det_jac)))
+            self.w = w
+            self.b = b
+            self.u = u
+            self.dtype = self.w.dtype.base_dtype
+            self.num_layers = self.w.shape[0].value
+
+    def create_flow_variables(self):
+        """Sets up one variable per parameter type for all flow layers."""
+        np_dtype = self.dtype.as_numpy_dtype
+        self.w = tf.Variable(np.random.normal(
+            0, 1, [self.num_layers, 1, self.dim]).astype(np_dtype))
+        self.b = tf.Variable(np.random.normal(
+            0, 1, [self.num_layers, 1]).astype(np_dtype))
+        self.u = tf.Variable(np.random.normal(
+            0, 1, [self.num_layers, 1, self.dim]).astype(np_dtype))
+
+    def transform_and_logdet(self, inputs):
+        """Applies the flow layers in order with a single tf.scan.
+
+        Parameters:
+        -----------
+        inputs: tensorflow.Tensor
+            Input of the first flow layer. See PlanarFlow.transform for
+            the expected shape.
+
+        Returns:
+        --------
+        tuple of tensorflow.Tensor where the first element is the output
+        of the last layer and the second is the sum of the
+        log-det-Jacobian terms of all layers.
+        """
+        def apply_layer(state, params):
+            samples, log_det = state
+            w, b, u = params
+            flow = PlanarFlow(self.dim, w=w, b=b, u=u)
+            samples, layer_log_det = flow.transform_and_logdet(samples)
+            return samples, log_det + layer_log_det
+
+        initial_log_det = tf.zeros_like(inputs[..., 0])
+        samples, log_det = tf.scan(
+            apply_layer, (self.w, self.b, self.u),
+            initializer=(inputs, initial_log_det))
+        return samples[-1], log_det[-1]
+
+    def transform(self, inputs):
+        """Transforms the inputs by all the flow layers.
+
+        The tf.scan only carries the samples so that none of the
+        log-det-Jacobian computation is part of the loop.
+        """
+        def apply_layer(samples, params):
+            w, b, u = params
+            flow = PlanarFlow(self.dim, w=w, b=b, u=u)
+            return flow.transform(samples)
+
+        samples = tf.scan(
+            apply_layer, (self.w, self.b, self.u), initializer=inputs)
+        return samples[-1]
 
 
 class FlowRandomVariable(object):
 
-    def __init__(self, dim, num_layers=1, flows=None,  base_dist=None):
+    def __init__(self, dim, num_layers=1, flows=None,  base_dist=None,
+                 dtype=tf.float32):
         """Sets up a normalizing flow random variable.
 
         Parameters:
@@ -104,27 +279,48 @@ class FlowRandomVariable(object):
         num_layers: int
             Number of layers of transformation for the nomralizing
             flow.
-        flows: list of normalizing_flow.PlanarFlow
+        flows: list of normalizing_flow.PlanarFlow or StackedPlanarFlow
             Parameters of the reversible tranformations. If None,
             the parameters are set to tf.Variables that are initialized
             randomly.
         base_dist: tensorflow.distributions
             Probability distribution of the original space.
+        dtype: tf.DType
+            Data type of the default base distribution and of the flow
+            variables. Ignored if flows is given, in which case the data
+            type of the flows is used.
         """
+        if isinstance(flows, StackedPlanarFlow):
+            dtype = flows.dtype
+        elif flows is not None:
+            dtype = flows[0].w.dtype.base_dtype
+        np_dtype = dtype.as_numpy_dtype
         if base_dist is None:
             base_dist = tf.distributions.Normal(
-                loc=np.zeros(dim), scale=np.ones(dim))
+                loc=np.zeros(dim, dtype=np_dtype),
+                scale=np.ones(dim, dtype=np_dtype))
         self.dim = dim
+        self.dtype = dtype
         self.num_layers = num_layers
         self.base_dist = base_dist
-        self.flows = flows
-        if self.flows is None:
-            self.num_layers = num_layers
-            self.flows = []
-            for i in range(self.num_layers):
-                self.flows.append(PlanarFlow(dim))
+        # Parameters of all layers are stacked along a leading layer axis
+        # so that the flows are applied by one tf.scan instead of a
+        # separate subgraph per layer.
+        if flows is None:
+            self.stacked_flow = StackedPlanarFlow(
+                dim, num_layers=num_layers, dtype=dtype)
+        elif isinstance(flows, StackedPlanarFlow):
+            self.num_layers = flows.num_layers
+            self.stacked_flow = flows
         else:
-            self.num_layrs = len(self.flows)
+            self.num_layers = len(flows)
+            w, b, u = stack_flow_params(flows)
+            self.stacked_flow = StackedPlanarFlow(dim, w=w, b=b, u=u)
+        self.w = self.stacked_flow.w
+        self.b = self.stacked_flow.b
+        self.u = self.stacked_flow.u
+        # Total number of flows of every layer.
+        self.n_flows = self.w.shape[1].value
 
     def get_all_flow_params(self):
         """Returns parameters of the flow layers.
@@ -135,35 +331,36 @@ class FlowRandomVariable(object):
         w variables of all flows. Simliarly, the second and the third
         elements are concatenated u and b variables.
         """
-        flow_range = range(self.num_layers)
-        all_w = tf.concat([self.flows[i].w for i in flow_range], axis=1)
-        all_u = tf.concat([self.flows[i].u for i in flow_range], axis=1)
-        all_b = tf.concat([self.flows[i].b for i in flow_range], axis=0)
+        # The stacked parameters already hold the layers contiguously,
+        # concatenation is a transpose and reshape of a single tensor.
+        concat_shape = [-1, self.num_layers * self.dim]
+        all_w = tf.reshape(tf.transpose(self.w, [1, 0, 2]), concat_shape)
+        all_u = tf.reshape(tf.transpose(self.u, [1, 0, 2]), concat_shape)
+        all_b = tf.reshape(self.b, [-1])
         return all_w, all_u, all_b
 
     def sample_log_prob(self, n_samples):
         """Provide samples from the flow distribution and its log prob."""
         if isinstance(self.base_dist, tf.distributions.Distribution):
-            if self.flows[0].is_single_flow():
+            if self.n_flows == 1:
                 samples = self.base_dist.sample(n_samples)
                 log_prob = tf.reduce_sum(
                     self.base_dist.log_prob(samples), axis=1)
             else:
-                n_flows = self.flows[0].get_flow_number()
-                samples = self.base_dist.sample([n_flows, n_samples])
+                samples = self.base_dist.sample([self.n_flows, n_samples])
                 log_prob = tf.reduce_sum(
                     self.base_dist.log_prob(samples), axis=2)           
         else:
             samples, log_prob = self.base_dist
-        for flow in self.flows:
-            log_prob += flow.log_det_jacobian(samples)
-            samples = flow.transform(samples)
-        return samples, log_prob
+        # Compile the chain of flow layers with XLA so that the small
+        # matmul/tanh/log ops of consecutive layers are fused.
+        with jit.experimental_jit_scope():
+            samples, log_det = self.stacked_flow.transform_and_logdet(
+                samples)
+        return samples, log_prob + log_det
 
     def transform(self, x):
-        for flow in self.flows:
-            x = flow.transform(x)
-        return x
+        return self.stacked_flow.transform(x)
 
 
 class FlowConditionalVariable(object):
@@ -186,23 +383,22 @@ class FlowConditionalVariable(object):
         self.set_up_flows()
 
     def set_up_flows(self):
-        # Non-linear function of Y
-        w_mlp = MultiLayerPerceptron(
-            self.y, layers=self.hidden_units + [self.dim_x * self.flow_layers], activation=tf.nn.tanh)
-        all_w = w_mlp.get_output_layer()
-        u_mlp = MultiLayerPerceptron(
-            self.y, layers=self.hidden_units + [self.dim_x * self.flow_layers], activation=tf.nn.tanh)
-        all_u = u_mlp.get_output_layer()
-        b_mlp = MultiLayerPerceptron(
-            self.y, layers=self.hidden_units + [self.flow_layers], activation=tf.nn.tanh)
-        all_b = b_mlp.get_output_layer()
-        # Slice the output layers into shapes of parameters of flows.
-        flows = []
-        for i in range(self.flow_layers):
-            w = tf.slice(all_w, [0, i * self.dim_x], [-1, self.dim_x])
-            u = tf.slice(all_u, [0, i * self.dim_x], [-1, self.dim_x])
-            b = tf.squeeze(tf.slice(all_b, [0, i], [-1, 1]))
-            flows.append(PlanarFlow(b, u=u, w=w, b=b))
+        # Non-linear function of Y. A single network whose output layer
+        # holds the w, u and b parameters of all flows shares the hidden
+        # layers between the three parameter groups.
+        n_params = self.dim_x * self.flow_layers
+        param_mlp = MultiLayerPerceptron(
+            self.y, layers=self.hidden_units + [2 * n_params + self.flow_layers], activation=tf.nn.tanh)
+        all_w, all_u, all_b = tf.split(
+            param_mlp.get_output_layer(),
+            [n_params, n_params, self.flow_layers], axis=1)
+        # Arrange the output layers into the stacked parameters of the
+        # flows whose leading axis is the layer.
+        param_shape = [-1, self.flow_layers, self.dim_x]
+        w = tf.transpose(tf.reshape(all_w, param_shape), [1, 0, 2])
+        u = tf.transpose(tf.reshape(all_u, param_shape), [1, 0, 2])
+        b = tf.transpose(all_b)
+        flows = StackedPlanarFlow(self.dim_x, w=w, b=b, u=u)
         self.variable = FlowRandomVariable(
             dim=self.dim_x, flows=flows, base_dist=self.base_dist)
         # Set up object reference to internal parameters
@@ -216,26 +412,88 @@ class FlowConditionalVariable(object):
 
 class DynaFlowRandomVariable(object):
 
-    def __init__(self, dim, time, num_layers, base_dist=None):
+    def __init__(self, dim, time, num_layers, base_dist=None,
+                 dtype=tf.float32):
         """Sets up the prelimnary computation graphs."""
         # Full dimensionality of the latent space.
         self.full_dim = dim * time
+        np_dtype = dtype.as_numpy_dtype
         if base_dist is None:
             base_dist = tf.distributions.Normal(
-                loc=np.zeros(self.full_dim), scale=np.ones(self.full_dim))
+                loc=np.zeros(self.full_dim, dtype=np_dtype),
+                scale=np.ones(self.full_dim, dtype=np_dtype))
         self.dim = dim
+        self.dtype = dtype
         self.n_time = time
         self.num_layers = num_layers
         self.base_dist = base_dist
-        self.flows = []
         # Set up planar flow layers.
         self.setup_flow_layers()
 
     def setup_flow_layers(self):
-        for t in range(self.n_time - 1):
-            self.flows.append([])
-            for i in range(self.num_layers):
-                self.flows[t].append(PlanarFlow(2 * self.dim))
+        """Sets up the parameters of the flow layers.
+
+        Parameters of all time steps and layers are held by one variable
+        per parameter type whose leading axes are (n_time - 1, num_layers).
+        """
+        np_dtype = self.dtype.as_numpy_dtype
+        param_shape = [self.n_time - 1, self.num_layers, 1]
+        self.w = tf.Variable(np.random.normal(
+            0, 1, param_shape + [2 * self.dim]).astype(np_dtype))
+        self.b = tf.Variable(np.random.normal(
+            0, 1, param_shape).astype(np_dtype))
+        self.u = tf.Variable(np.random.normal(
+            0, 1, param_shape + [2 * self.dim]).astype(np_dtype))
+
+    def compose_time_flows(self, samples):
+        """Transforms every pair of consecutive time steps of the samples.
+
+        The time steps are visited by a single tf.scan that carries the
+        transformed latent of the previous pair to the next one.
+
+        Parameters:
+        -----------
+        samples: tensorflow.Tensor
+            Shape should be [..., self.n_time * self.dim].
+
+        Returns:
+        --------
+        tuple of tensorflow.Tensor where the first element is the
+        transformed samples and the second is the sum of the
+        log-det-Jacobian terms of all flows.
+        """
+        if self.n_time == 1:
+            # There are no consecutive time steps to transform.
+            return samples, tf.zeros_like(samples[..., 0])
+        batch_shape = tf.shape(samples)[:-1]
+        rank = samples.shape.ndims
+        # Latent of each time step with time as the leading axis.
+        latent = tf.reshape(
+            samples, tf.concat([batch_shape, [self.n_time, self.dim]], 0))
+        time_first = [rank - 1] + list(range(rank - 1)) + [rank]
+        latent = tf.transpose(latent, time_first)
+
+        def transform_pair(state, elems):
+            pre_latent, _, _ = state
+            cur_latent, w, b, u = elems
+            latent_pair = tf.concat([pre_latent, cur_latent], axis=-1)
+            time_flow = StackedPlanarFlow(2 * self.dim, w=w, b=b, u=u)
+            latent_pair, log_det = time_flow.transform_and_logdet(latent_pair)
+            out_latent, next_latent = tf.split(latent_pair, 2, axis=-1)
+            return next_latent, out_latent, log_det
+
+        initial_state = (latent[0], tf.zeros_like(latent[0]),
+                         tf.zeros_like(latent[0][..., 0]))
+        next_latent, out_latent, log_det = tf.scan(
+            transform_pair, (latent[1:], self.w, self.b, self.u),
+            initializer=initial_state)
+        # Last time stamp does does not have a following variable.
+        final_samples = tf.concat([out_latent, next_latent[-1:]], axis=0)
+        time_last = list(range(1, rank)) + [0, rank]
+        final_samples = tf.reshape(
+            tf.transpose(final_samples, time_last),
+            tf.concat([batch_shape, [self.full_dim]], 0))
+        return final_samples, tf.reduce_sum(log_det, axis=0)
 
     def sample_log_prob(self, n_samples):
         """Provide samples from the flow distribution and its log prob."""
@@ -243,29 +501,12 @@ class DynaFlowRandomVariable(object):
         log_prob = tf.reduce_sum(
             self.base_dist.log_prob(samples), axis=1)
         # Transform two consecutive variables in time.
-        final_samples = []
-        single_time_latent_size = [n_samples, self.dim]
-        pre_latent = tf.slice(samples, [0, 0], single_time_latent_size)
-        for i, time_flow in enumerate(self.flows):
-            cur_latent = tf.slice(
-                samples, [0, (i + 1) * self.dim], single_time_latent_size)
-            latent_pair = tf.concat([pre_latent, cur_latent], axis=1)
-            for layer in time_flow:
-                log_prob += layer.log_det_jacobian(latent_pair)
-                latent_pair = layer.transform(latent_pair)
-            # Accumulate the transformed time subsets.
-            final_samples.append(
-                tf.slice(latent_pair, [0, 0], single_time_latent_size))
-            pre_latent = tf.slice(
-                latent_pair, [0, self.dim], single_time_latent_size)
-        # Last time stamp does does not have a following variable.
-        final_samples.append(pre_latent)
-        # Concatenate the subsets to form a single tensor.
-        final_samples = tf.concat(final_samples, axis=1)
-        return final_samples, log_prob
+        with jit.experimental_jit_scope():
+            samples, log_det = self.compose_time_flows(samples)
+        return samples, log_prob + log_det
 
 
-class DynaFlowConditionalRandomVariable(object):
+class DynaFlowConditionalRandomVariable(DynaFlowRandomVariable):
 
     def __init__(self, y, dim, time, num_layers, base_dist=None):
         """Sets up the prelimnary computation graphs.
@@ -284,111 +525,53 @@ class DynaFlowConditionalRandomVariable(object):
         base_dist: tf.distributions.Distribution or (tf.Tensor, tf.Tensor)
             Initial distribution to be transformed by the normalizing flow.
         """
-        # Full dimensionality of the latent space.
-        self.full_dim = dim * time
-        if base_dist is None:
-            base_dist = tf.distributions.Normal(
-                loc=np.zeros(self.full_dim), scale=np.ones(self.full_dim))
-        self.dim = dim
-        self.n_time = time
-        self.num_layers = num_layers
-        self.base_dist = base_dist
-        self.flows = []
         # Input properties
         self.y = y
         self.n_example = y.shape[0].value
-        self.obs_dim = y.shape[1].value // self.n_time
-        # Set up planar flow layers.
-        self.setup_flow_layers()
+        self.obs_dim = y.shape[1].value // time
+        super(DynaFlowConditionalRandomVariable, self).__init__(
+            dim=dim, time=time, num_layers=num_layers, base_dist=base_dist,
+            dtype=y.dtype)
 
     def unfold_time_pairs(self):
         unfold = tf.reshape(self.y, [self.n_example, self.n_time, self.obs_dim])
-        x1 = tf.slice(unfold, [0, 0, 0], [-1, self.n_time - 1, -1])
-        x2 = tf.slice(unfold, [0, 1, 0], [-1, -1, -1])
+        x1 = unfold[:, :-1]
+        x2 = unfold[:, 1:]
         unfold_x = tf.reshape(
             tf.concat([x1, x2], axis=2), [self.n_example * (self.n_time - 1), 2 * self.obs_dim])
         return unfold_x
 
-    def get_flow_parameters(self, param_group, time, layer, dim):
-        param_group = tf.reshape(
-            param_group, [self.n_example, self.n_time - 1, dim * self.num_layers])
-        return tf.squeeze(tf.slice(
-            param_group,
-            [0, time, layer * dim],
-            [-1, 1, dim]))
-    
     def setup_flow_layers(self):
         """Sets up the network regulating parameters of the flow."""
         hidden_units = 128
         unfolded = self.unfold_time_pairs()
-        self.u_mlp = MultiLayerPerceptron(
-            unfolded, layers=[hidden_units, hidden_units, self.dim * 2 * self.num_layers]).get_output_layer()
-        self.w_mlp = MultiLayerPerceptron(
-            unfolded, layers=[hidden_units, hidden_units, self.dim * 2 * self.num_layers]).get_output_layer()
-        self.b_mlp = MultiLayerPerceptron(
-            unfolded, layers=[hidden_units, hidden_units, self.num_layers]).get_output_layer()
-        for t in range(self.n_time - 1):
-            self.flows.append([])
-            for i in range(self.num_layers):
-                time_layer_u = self.get_flow_parameters(self.u_mlp, time=t, layer=i, dim=self.dim * 2)
-                time_layer_w = self.get_flow_parameters(self.w_mlp, time=t, layer=i, dim=self.dim * 2)
-                time_layer_b = self.get_flow_parameters(self.b_mlp, time=t, layer=i, dim=1)
-                if len(time_layer_u.shape) == 1:
-                    time_layer_u = tf.expand_dims(time_layer_u, 0)
-                    time_layer_w = tf.expand_dims(time_layer_w, 0)
-                    time_layer_b = tf.expand_dims(time_layer_b, 0)
-                self.flows[t].append(
-                    PlanarFlow(2 * self.dim, u=time_layer_u, w=time_layer_w, b=time_layer_b))
+        # One network produces the u, w and b parameters of all flows.
+        n_params = self.dim * 2 * self.num_layers
+        param_mlp = MultiLayerPerceptron(
+            unfolded, layers=[hidden_units, hidden_units, 2 * n_params + self.num_layers]).get_output_layer()
+        self.u_mlp, self.w_mlp, self.b_mlp = tf.split(
+            param_mlp, [n_params, n_params, self.num_layers], axis=1)
+        # Unpack the parameters once into shape
+        # (n_example, n_time - 1, num_layers, ...) and move the examples
+        # behind the time and layer axes.
+        param_shape = [self.n_example, self.n_time - 1, self.num_layers]
+        u = tf.reshape(self.u_mlp, param_shape + [2 * self.dim])
+        w = tf.reshape(self.w_mlp, param_shape + [2 * self.dim])
+        b = tf.reshape(self.b_mlp, param_shape)
+        self.w = tf.transpose(w, [1, 2, 0, 3])
+        self.b = tf.transpose(b, [1, 2, 0])
+        self.u = tf.transpose(u, [1, 2, 0, 3])
 
     def sample_log_prob(self, n_samples):
         """Provide samples from the flow distribution and its log prob."""
         if self.n_example == 1:
-            samples = self.base_dist.sample(n_samples)
-            log_prob = tf.reduce_sum(
-                self.base_dist.log_prob(samples), axis=1)
-            # Transform two consecutive variables in time.
-            final_samples = []
-            single_time_latent_size = [n_samples, self.dim]
-            pre_latent = tf.slice(samples, [0, 0], single_time_latent_size)
-            for i, time_flow in enumerate(self.flows):
-                cur_latent = tf.slice(
-                    samples, [0, (i + 1) * self.dim], single_time_latent_size)
-                latent_pair = tf.concat([pre_latent, cur_latent], axis=1)
-                for layer in time_flow:
-                    log_prob += layer.log_det_jacobian(latent_pair)
-                    latent_pair = layer.transform(latent_pair)
-                # Accumulate the transformed time subsets.
-                final_samples.append(
-                    tf.slice(latent_pair, [0, 0], single_time_latent_size))
-                pre_latent = tf.slice(
-                    latent_pair, [0, self.dim], single_time_latent_size)
-            # Last time stamp does does not have a following variable.
-            final_samples.append(pre_latent)
-            # Concatenate the subsets to form a single tensor.
-            final_samples = tf.concat(final_samples, axis=1)
-            return final_samples, log_prob
+            return super(DynaFlowConditionalRandomVariable,
+                         self).sample_log_prob(n_samples)
         else:
             samples = self.base_dist.sample([self.n_example, n_samples])
             log_prob = tf.reduce_sum(
                 self.base_dist.log_prob(samples), axis=2)
             # Transform two consecutive variables in time.
-            final_samples = []
-            single_time_latent_size = [self.n_example, n_samples, self.dim]
-            pre_latent = tf.slice(samples, [0, 0, 0], single_time_latent_size)
-            for i, time_flow in enumerate(self.flows):
-                cur_latent = tf.slice(
-                    samples, [0, 0, (i + 1) * self.dim], single_time_latent_size)
-                latent_pair = tf.concat([pre_latent, cur_latent], axis=2)
-                for layer in time_flow:
-                    log_prob += layer.log_det_jacobian(latent_pair)
-                    latent_pair = layer.transform(latent_pair)
-                # Accumulate the transformed time subsets.
-                final_samples.append(
-                    tf.slice(latent_pair, [0, 0, 0], single_time_latent_size))
-                pre_latent = tf.slice(
-                    latent_pair, [0, 0, self.dim], single_time_latent_size)
-            # Last time stamp does does not have a following variable.
-            final_samples.append(pre_latent)
-            # Concatenate the subsets to form a single tensor.
-            final_samples = tf.concat(final_samples, axis=2)
-            return final_samples, log_prob
+            with jit.experimental_jit_scope():
+                samples, log_det = self.compose_time_flows(samples)
+            return samples, log_prob + log_det
@@ -0,0 +1,277 @@
+import numpy as np
+import tensorflow as tf
+
+import normalizing_flow as nf
+
+
+def random_flow_params(num_layers, n_flows, dim):
+    """Returns constant parameters of a stack of planar flow layers.
+
+    params:
+    -------
+    num_layers: int
+        Number of flow layers.
+    n_flows: int
+        Number of flows in each layer.
+    dim: int
+        Dimensionality of the input of the flows.
+    returns:
+    --------
+    tuple of tf.Tensor of shapes (num_layers, n_flows, dim),
+    (num_layers, n_flows) and (num_layers, n_flows, dim).
+    """
+    w = tf.constant(np.random.normal(0, 1, [num_layers, n_flows, dim]))
+    b = tf.constant(np.random.normal(0, 1, [num_layers, n_flows]))
+    u = tf.constant(np.random.normal(0, 1, [num_layers, n_flows, dim]))
+    return w, b, u
+
+def flow_params_with_dot(dot, dim):
+    """Returns parameters of planar flows with given u . w products.
+
+    params:
+    -------
+    dot: np.ndarray of shape (N,)
+        Dot product of u and w of each flow.
+    dim: int
+        Dimensionality of the input of the flows.
+    returns:
+    --------
+    tuple of np.ndarray of shapes (N, dim), (N,) and (N, dim).
+    """
+    n_flows = len(dot)
+    w = np.random.normal(0, 1, [n_flows, dim])
+    b = np.random.normal(0, 1, n_flows)
+    u = np.random.normal(0, 1, [n_flows, dim])
+    norm_squared = np.sum(w * w, axis=1, keepdims=True)
+    # Replace the component of u along w to get the desired product.
+    u += (dot[:, None] - np.sum(u * w, axis=1, keepdims=True)) * w / norm_squared
+    return w, b, u
+
+def planar_flow_reference(inputs, w, b, u):
+    """Computes a planar flow in numpy with the original formulas.
+
+    params:
+    -------
+    inputs: np.ndarray of shape (N, n, dim)
+        Inputs of each of the N flows.
+    w, b, u: np.ndarray of shapes (N, dim), (N,) and (N, dim)
+        Parameters of the flows.
+    returns:
+    --------
+    tuple of np.ndarray where the elements are u_bar, u_bar . w, the
+    transformed inputs and the log-det-Jacobian.
+    """
+    dot = np.sum(u * w, axis=1, keepdims=True)
+    softplus = np.logaddexp(0, dot)
+    norm_squared = np.sum(w * w, axis=1, keepdims=True)
+    u_bar = u + (-1 + softplus - dot) * w / norm_squared
+    uw = np.sum(u_bar * w, axis=1, keepdims=True)
+    dialation = np.sum(inputs * w[:, None], axis=2) + b[:, None]
+    non_lin = np.tanh(dialation)
+    transformed = inputs + u_bar[:, None] * non_lin[:, :, None]
+    psi = 1 - non_lin ** 2
+    log_det = - np.log(np.abs(1 + uw * psi))
+    return u_bar, uw, transformed, log_det
+
+def layer_by_layer(inputs, w, b, u):
+    """Applies planar flow layers one at a time.
+
+    params:
+    -------
+    inputs: tf.Tensor
+        Input of the first layer. See PlanarFlow.transform for the shape.
+    w, b, u: tf.Tensor
+        Parameters of the layers stacked along the leading axis.
+    returns:
+    --------
+    tuple of tf.Tensor where the first element is the output of the last
+    layer and the second is the sum of the log-det-Jacobian terms.
+    """
+    dim = w.shape[-1].value
+    log_det = 0.
+    for i in range(w.shape[0].value):
+        flow = nf.PlanarFlow(dim, w=w[i], b=b[i], u=u[i])
+        log_det += flow.log_det_jacobian(inputs)
+        inputs = flow.transform(inputs)
+    return inputs, log_det
+
+def time_pair_by_time_pair(samples, dyna):
+    """Applies the flows of a DynaFlowRandomVariable one time step at a time.
+
+    params:
+    -------
+    samples: tf.Tensor of shape (..., dyna.n_time * dyna.dim)
+        Samples of the base distribution.
+    dyna: normalizing_flow.DynaFlowRandomVariable
+        Random variable whose flow parameters are used.
+    returns:
+    --------
+    tuple of tf.Tensor where the first element is the transformed samples
+    and the second is the sum of the log-det-Jacobian terms.
+    """
+    dim = dyna.dim
+    latent = [samples[..., t * dim:(t + 1) * dim] for t in range(dyna.n_time)]
+    pre_latent = latent[0]
+    out_latent = []
+    log_det = 0.
+    for t in range(dyna.n_time - 1):
+        latent_pair = tf.concat([pre_latent, latent[t + 1]], axis=-1)
+        latent_pair, pair_log_det = layer_by_layer(
+            latent_pair, dyna.w[t], dyna.b[t], dyna.u[t])
+        log_det += pair_log_det
+        out_latent.append(latent_pair[..., :dim])
+        pre_latent = latent_pair[..., dim:]
+    out_latent.append(pre_latent)
+    return tf.concat(out_latent, axis=-1), log_det
+
+def test_stacked_single_flow():
+    """Tests the stacked layers of a single flow against a loop over layers."""
+    num_layers = 3
+    dim = 4
+    n_samples = 10
+    with tf.Graph().as_default():
+        w, b, u = random_flow_params(num_layers, 1, dim)
+        inputs = tf.constant(np.random.normal(0, 1, [n_samples, dim]))
+        stacked = nf.StackedPlanarFlow(dim, w=w, b=b, u=u)
+        result = stacked.transform_and_logdet(inputs)
+        expected = layer_by_layer(inputs, w, b, u)
+        with tf.Session() as sess:
+            result, expected = sess.run([result, expected])
+    assert np.allclose(result[0], expected[0]), 'Single flow transform'
+    assert np.allclose(result[1], expected[1]), 'Single flow log-det'
+
+def test_stacked_multi_flow():
+    """Tests the stacked layers of multiple flows against a loop over layers."""
+    num_layers = 3
+    n_flows = 5
+    dim = 4
+    n_samples = 10
+    with tf.Graph().as_default():
+        w, b, u = random_flow_params(num_layers, n_flows, dim)
+        inputs = tf.constant(
+            np.random.normal(0, 1, [n_flows, n_samples, dim]))
+        stacked = nf.StackedPlanarFlow(dim, w=w, b=b, u=u)
+        result = stacked.transform_and_logdet(inputs)
+        expected = layer_by_layer(inputs, w, b, u)
+        with tf.Session() as sess:
+            result, expected = sess.run([result, expected])
+    assert np.allclose(result[0], expected[0]), 'Multi flow transform'
+    assert np.allclose(result[1], expected[1]), 'Multi flow log-det'
+
+def test_dyna_flow():
+    """Tests the time scan of DynaFlowRandomVariable against a loop over time."""
+    dim = 2
+    time = 4
+    num_layers = 3
+    n_samples = 10
+    with tf.Graph().as_default():
+        dyna = nf.DynaFlowRandomVariable(
+            dim=dim, time=time, num_layers=num_layers, dtype=tf.float64)
+        samples = tf.constant(
+            np.random.normal(0, 1, [n_samples, time * dim]))
+        result = dyna.compose_time_flows(samples)
+        expected = time_pair_by_time_pair(samples, dyna)
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            result, expected = sess.run([result, expected])
+    assert np.allclose(result[0], expected[0]), 'Dyna flow transform'
+    assert np.allclose(result[1], expected[1]), 'Dyna flow log-det'
+
+def test_dyna_flow_single_time():
+    """Tests that a single time step leaves the samples unchanged."""
+    dim = 2
+    n_samples = 10
+    with tf.Graph().as_default():
+        dyna = nf.DynaFlowRandomVariable(
+            dim=dim, time=1, num_layers=2, dtype=tf.float64)
+        samples = tf.constant(np.random.normal(0, 1, [n_samples, dim]))
+        result = dyna.compose_time_flows(samples)
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            result, samples = sess.run([result, samples])
+    assert np.allclose(result[0], samples), 'Single time step transform'
+    assert np.allclose(result[1], 0.), 'Single time step log-det'
+
+def test_dyna_flow_conditional():
+    """Tests the time scan of a conditional Dyna flow with several examples."""
+    dim = 2
+    obs_dim = 3
+    time = 4
+    num_layers = 3
+    n_example = 5
+    n_samples = 10
+    with tf.Graph().as_default():
+        y = tf.constant(np.random.normal(0, 1, [n_example, time * obs_dim]))
+        dyna = nf.DynaFlowConditionalRandomVariable(
+            y=y, dim=dim, time=time, num_layers=num_layers)
+        samples = tf.constant(
+            np.random.normal(0, 1, [n_example, n_samples, time * dim]))
+        result = dyna.compose_time_flows(samples)
+        expected = time_pair_by_time_pair(samples, dyna)
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            result, expected = sess.run([result, expected])
+    assert np.allclose(result[0], expected[0]), 'Conditional Dyna transform'
+    assert np.allclose(result[1], expected[1]), 'Conditional Dyna log-det'
+
+def test_planar_flow_reference():
+    """Tests planar flows against the original formulas including large u . w."""
+    dim = 3
+    n_samples = 10
+    dot = np.array([-20., -5., -0.5, 0., 1., 5., 20.])
+    w, b, u = flow_params_with_dot(dot, dim)
+    inputs = np.random.normal(0, 1, [len(dot), n_samples, dim])
+    expected = planar_flow_reference(inputs, w, b, u)
+    with tf.Graph().as_default():
+        flow = nf.PlanarFlow(
+            dim, w=tf.constant(w), b=tf.constant(b), u=tf.constant(u))
+        inputs = tf.constant(inputs)
+        result = (flow.u_bar, flow.uw, flow.transform(inputs),
+                  flow.log_det_jacobian(inputs),
+                  flow.transform_and_logdet(inputs))
+        with tf.Session() as sess:
+            result = sess.run(result)
+    assert np.allclose(result[0], expected[0]), 'Reversible constraint'
+    assert np.allclose(result[1], expected[1]), 'u_bar . w'
+    assert np.allclose(result[2], expected[2]), 'Transform'
+    assert np.allclose(result[3], expected[3]), 'Log-det'
+    assert np.allclose(result[4][0], expected[2]), 'Fused transform'
+    assert np.allclose(result[4][1], expected[3]), 'Fused log-det'
+
+def test_planar_flow_reference_single_flow():
+    """Tests a single planar flow against the original formulas."""
+    dim = 3
+    n_samples = 10
+    for dot in [-20., 0.5, 20.]:
+        w, b, u = flow_params_with_dot(np.array([dot]), dim)
+        inputs = np.random.normal(0, 1, [n_samples, dim])
+        expected = planar_flow_reference(inputs[None], w, b, u)
+        with tf.Graph().as_default():
+            flow = nf.PlanarFlow(
+                dim, w=tf.constant(w), b=tf.constant(b), u=tf.constant(u))
+            inputs = tf.constant(inputs)
+            result = flow.transform_and_logdet(inputs)
+            with tf.Session() as sess:
+                result = sess.run(result)
+        assert np.allclose(result[0], expected[2][0]), 'Single flow transform'
+        assert np.allclose(result[1], expected[3][0]), 'Single flow log-det'
+
+def test_all_flow_params():
+    """Tests concatenated flow parameters against concatenating each flow."""
+    num_layers = 3
+    n_flows = 2
+    dim = 4
+    with tf.Graph().as_default():
+        w, b, u = random_flow_params(num_layers, n_flows, dim)
+        flows = [nf.PlanarFlow(dim, w=w[i], b=b[i], u=u[i])
+                 for i in range(num_layers)]
+        variable = nf.FlowRandomVariable(dim, flows=flows)
+        result = variable.get_all_flow_params()
+        expected = (tf.concat([flow.w for flow in flows], axis=1),
+                    tf.concat([flow.u for flow in flows], axis=1),
+                    tf.concat([flow.b for flow in flows], axis=0))
+        with tf.Session() as sess:
+            result, expected = sess.run([result, expected])
+    for res, exp in zip(result, expected):
+        assert res.shape == exp.shape, 'Shape of flow parameters'
+        assert np.allclose(res, exp), 'Concatenated flow parameters'